@@ -1,29 +1,208 @@
 import sys
-from typing import List, Optional
+from typing import Dict, List, Optional
 
+import numpy as np
 import torch
+import triton
+import triton.language as tl
 from torch import nn
 
-from .attention import (
-    ForwardContext,
-    get_forward_context,
-    reset_forward_context,
-    set_forward_context,
-)
+from .attention import reset_forward_context, set_forward_context
 from .kv_manager import KVCacheManager, Seq
 
 
+@triton.jit
+def prepare_decode_meta_kernel(
+    last_token_ptr,
+    length_ptr,
+    block_tables_ptr,
+    block_tables_stride,
+    input_ids_ptr,
+    positions_ptr,
+    slot_mapping_ptr,
+    context_lens_ptr,
+    pos_offset_ptr,
+    KV_BLOCK_SIZE: tl.constexpr,
+):
+    idx = tl.program_id(0)
+    length = tl.load(length_ptr + idx)
+    pos_offset = tl.load(pos_offset_ptr)
+    # Graph padding rows have length 0: skip the KV write, attend to nothing
+    valid = length > 0
+    last = tl.maximum(length - 1, 0)
+    block_id = tl.load(
+        block_tables_ptr + idx * block_tables_stride + last // KV_BLOCK_SIZE,
+        mask=valid,
+        other=0,
+    )
+    slot = tl.where(valid, block_id * KV_BLOCK_SIZE + last % KV_BLOCK_SIZE, -1)
+    tl.store(input_ids_ptr + idx, tl.load(last_token_ptr + idx))
+    # TTS positions count from the start_mel token; the prompt before it clamps to 0
+    tl.store(positions_ptr + idx, tl.maximum(last - pos_offset, 0).to(tl.int64))
+    tl.store(slot_mapping_ptr + idx, slot)
+    tl.store(context_lens_ptr + idx, length)
+
+
+def prepare_decode_meta(
+    seq_state: Dict[str, torch.Tensor],
+    block_tables: torch.Tensor,
+    block_size: int,
+    pos_offset: torch.Tensor,
+    input_ids: torch.Tensor,
+    positions: torch.Tensor,
+    slot_mapping: torch.Tensor,
+    context_lens: torch.Tensor,
+):
+    bs = input_ids.numel()
+    assert block_tables.stride(-1) == 1
+    prepare_decode_meta_kernel[(bs,)](
+        seq_state["last_token"],
+        seq_state["length"],
+        block_tables,
+        block_tables.stride(0),
+        input_ids,
+        positions,
+        slot_mapping,
+        context_lens,
+        pos_offset,
+        block_size,
+    )
+
+
+@triton.jit
+def tts_embed_add_kernel(
+    input_ids_ptr,
+    positions_ptr,
+    mel_weight_ptr,
+    mel_weight_stride,
+    pos_weight_ptr,
+    pos_weight_stride,
+    out_ptr,
+    out_stride,
+    hidden_size,
+    BLOCK_H: tl.constexpr,
+):
+    idx = tl.program_id(0)
+    token = tl.load(input_ids_ptr + idx)
+    pos = tl.load(positions_ptr + idx)
+    for start in range(0, hidden_size, BLOCK_H):
+        offs = start + tl.arange(0, BLOCK_H)
+        mask = offs < hidden_size
+        mel = tl.load(mel_weight_ptr + token * mel_weight_stride + offs, mask=mask)
+        pos_emb = tl.load(pos_weight_ptr + pos * pos_weight_stride + offs, mask=mask)
+        emb = mel.to(tl.float32) + pos_emb.to(tl.float32)
+        tl.store(
+            out_ptr + idx * out_stride + offs,
+            emb.to(out_ptr.dtype.element_ty),
+            mask=mask,
+        )
+
+
+def tts_embed_add(
+    input_ids: torch.Tensor,
+    positions: torch.Tensor,
+    mel_weight: torch.Tensor,
+    pos_weight: torch.Tensor,
+    out_dtype: torch.dtype,
+) -> torch.Tensor:
+    # mel_weight[input_ids] + pos_weight[positions] in a single pass
+    bs = input_ids.numel()
+    hidden_size = mel_weight.size(1)
+    assert mel_weight.stride(-1) == 1 and pos_weight.stride(-1) == 1
+    out = torch.empty(bs, hidden_size, dtype=out_dtype, device=mel_weight.device)
+    tts_embed_add_kernel[(bs,)](
+        input_ids,
+        positions,
+        mel_weight,
+        mel_weight.stride(0),
+        pos_weight,
+        pos_weight.stride(0),
+        out,
+        out.stride(0),
+        hidden_size,
+        BLOCK_H=1024,
+    )
+    return out
+
+
+@triton.jit
+def sample_from_logits_kernel(
+    logits_ptr,
+    logits_stride,
+    temperatures_ptr,
+    seed_ptr,
+    out_ptr,
+    vocab_size,
+    BLOCK_V: tl.constexpr,
+):
+    # Gumbel-max sampling: argmax(logits / t + g) with g = -log(-log(u)) draws
+    # from softmax(logits / t), so probabilities are never materialized.
+    row = tl.program_id(0)
+    temp = tl.load(temperatures_ptr + row)
+    greedy = temp <= 0.0
+    inv_temp = tl.where(greedy, 1.0, 1.0 / temp)
+    seed = tl.load(seed_ptr)
+
+    best_val = tl.full([BLOCK_V], float("-inf"), tl.float32)
+    best_idx = tl.zeros([BLOCK_V], tl.int32)
+    for start in range(0, vocab_size, BLOCK_V):
+        offs = start + tl.arange(0, BLOCK_V)
+        mask = offs < vocab_size
+        logits = tl.load(
+            logits_ptr + row * logits_stride + offs, mask=mask, other=float("-inf")
+        ).to(tl.float32)
+        u = tl.rand(seed, row * vocab_size + offs)
+        noise = -tl.log(tl.maximum(-tl.log(u), 1e-10))
+        score = logits * inv_temp + tl.where(greedy, 0.0, noise)
+        score = tl.where(mask, score, float("-inf"))
+        better = score > best_val
+        best_val = tl.where(better, score, best_val)
+        best_idx = tl.where(better, offs, best_idx)
+
+    max_val = tl.max(best_val, axis=0)
+    token = tl.min(tl.where(best_val == max_val, best_idx, vocab_size), axis=0)
+    tl.store(out_ptr + row, token.to(tl.int64))
+
+
+def sample_from_logits(
+    logits: torch.Tensor, temperatures: torch.Tensor, seed: torch.Tensor
+) -> torch.Tensor:
+    bs, vocab_size = logits.shape
+    assert logits.stride(-1) == 1
+    # The kernel reads one temperature per row with no bounds check
+    assert temperatures.numel() >= bs
+    out = torch.empty(bs, dtype=torch.int64, device=logits.device)
+    sample_from_logits_kernel[(bs,)](
+        logits,
+        logits.stride(0),
+        temperatures,
+        seed,
+        out,
+        vocab_size,
+        BLOCK_V=1024,
+    )
+    return out
+
+
 class Sampler(nn.Module):
     def __init__(self):
         super().__init__()
+        # Philox seed for the Gumbel noise. It lives on the device and is
+        # advanced after every draw, so CUDA graph replays see fresh noise.
+        self.register_buffer(
+            "seed",
+            torch.randint(0, 2**62, (1,), dtype=torch.int64),
+            persistent=False,
+        )
+
+    def reseed(self):
+        # Draw from torch's CUDA generator so torch.manual_seed still applies
+        self.seed.random_(0, 2**62)
 
-    @torch.compile
     def forward(self, logits: torch.Tensor, temperatures: torch.Tensor):
-        logits = logits.float().div_(temperatures.unsqueeze(dim=1))
-        probs = torch.softmax(logits, dim=-1)
-        sample_tokens = probs.div_(
-            torch.empty_like(probs).exponential_(1).clamp_min_(1e-10)
-        ).argmax(dim=-1)
+        # Rows with a non-positive temperature take the greedy argmax
+        sample_tokens = sample_from_logits(logits, temperatures, self.seed)
+        self.seed.add_(1)
         return sample_tokens
 
 
@@ -38,6 +217,7 @@ class AccelInferenceEngine:
         block_size: int = 256,
         num_blocks: int = 128,
         use_cuda_graph: bool = True,
+        kv_cache_dtype: torch.dtype = torch.float16,
     ):
         """
         Args:
@@ -49,13 +229,26 @@ class AccelInferenceEngine:
             block_size: KV cache block size
             num_blocks: Total number of KV cache blocks
             use_cuda_graph: Whether to use CUDA Graph for decode optimization
+            kv_cache_dtype: KV cache dtype, torch.float16 or torch.bfloat16
         """
+        # flash_attn's paged KV kernels only take 16-bit caches: fp32 would
+        # double decode KV traffic and fp8 is not supported by this backend.
+        if kv_cache_dtype not in (torch.float16, torch.bfloat16):
+            raise ValueError(
+                f"kv_cache_dtype must be torch.float16 or torch.bfloat16, got {kv_cache_dtype}"
+            )
         self.model = model
         self.lm_head = lm_head
         self.block_size = block_size
         self.num_blocks = num_blocks
         self.use_cuda_graph = use_cuda_graph and torch.cuda.is_available()
-        model_dtype = next(model.parameters()).dtype
+        # Resolved once: walking the parameter iterator is not free in hot paths
+        self._model_dtype = next(model.parameters()).dtype
+        self._lm_head_dtype = (
+            next(lm_head.parameters()).dtype if lm_head is not None else None
+        )
+        self._tts_mode = False
+        self._tts_prompt_len = 0
         self.hidden_size = (
             model.config.hidden_size
             if hasattr(model, "config")
@@ -67,29 +260,75 @@ class AccelInferenceEngine:
             head_dim=head_dim,
             block_size=block_size,
             num_blocks=num_blocks,
-            dtype=torch.float16,  # Force fp16 for FlashAttention
+            dtype=kv_cache_dtype,
         )
         self.kv_manager.wire_kv_cache_to_model(model)
-        self.sampler = Sampler()
+        self.max_bs = 8  # Largest batch covered by decode buffers and CUDA graphs
+        self.max_num_blocks = num_blocks
+        self.stop_check_interval = 16  # Decode steps between host stop checks
+
+        # Persistent decode buffers. The block table is staged through a pinned
+        # host buffer once per generate and then patched in place on the device
+        # as blocks are allocated, so the decode loop never re-uploads it.
+        self._pin_block_tables = torch.full(
+            (self.max_bs, self.max_num_blocks), -1, dtype=torch.int32, pin_memory=True
+        )
+        self._dev_input_ids = torch.zeros(
+            self.max_bs, dtype=torch.int64, device="cuda"
+        )
+        self._dev_positions = torch.zeros(
+            self.max_bs, dtype=torch.int64, device="cuda"
+        )
+        self._dev_slot_mapping = torch.full(
+            (self.max_bs,), -1, dtype=torch.int32, device="cuda"
+        )
+        self._dev_context_lens = torch.zeros(
+            self.max_bs, dtype=torch.int32, device="cuda"
+        )
+        self._dev_block_tables = torch.full(
+            (self.max_bs, self.max_num_blocks), -1, dtype=torch.int32, device="cuda"
+        )
+        self._dev_next_token = torch.zeros(
+            self.max_bs, dtype=torch.int64, device="cuda"
+        )
+        # Device-side so the metadata kernel can be captured with the graphs
+        self._pos_offset = torch.zeros(1, dtype=torch.int32, device="cuda")
+        self._staging_done = torch.cuda.Event()
+        self._h2d_stream = torch.cuda.Stream()
+        self._h2d_done = torch.cuda.Event()
+        # Recorded on the compute stream once a generate stops reading the
+        # device block tables; only their rewrite has to wait for it.
+        self._block_tables_released = torch.cuda.Event()
+        # Filled once per generate; doubles as the captured graphs' input
+        self._temperatures_dev = torch.ones(
+            self.max_bs, dtype=torch.float32, device="cuda"
+        )
+
+        # Authoritative per-slot decode state kept on the GPU. Each decode step
+        # derives its metadata from it and advances it, all inside the graph.
+        self._seq_state = {
+            "last_token": torch.zeros(self.max_bs, dtype=torch.int64, device="cuda"),
+            "length": torch.zeros(self.max_bs, dtype=torch.int32, device="cuda"),
+        }
+
+        self.sampler = Sampler().cuda()
         self.current_sequences = []
         self.graphs = {}
+        self._bs_to_graph_bs: List[Optional[int]] = []
         self.graph_vars = None
         self.graph_pool = None
         self.graph_captured = False
 
     def _prepare_prefill(self, requests: List[Seq]):
-        input_ids = []
-        positions = []
         cu_seqlens_q = [0]
         cu_seqlens_k = [0]
         max_seqlen_q = 0
         max_seqlen_k = 0
         slot_mapping = []
+        block_offsets = np.arange(self.block_size, dtype=np.int32)
 
         for req in requests:
             seqlen = len(req)
-            input_ids.extend(req[req.num_cached_tokens :])
-            positions.extend(list(range(req.num_cached_tokens, seqlen)))
             seqlen_q = seqlen - req.num_cached_tokens
             seqlen_k = seqlen
             cu_seqlens_q.append(cu_seqlens_q[-1] + seqlen_q)
@@ -97,42 +336,45 @@ class AccelInferenceEngine:
             max_seqlen_q = max(seqlen_q, max_seqlen_q)
             max_seqlen_k = max(seqlen_k, max_seqlen_k)
 
-            if req.block_table:
-                for i in range(req.num_cached_blocks, req.num_blocks):
-                    block_id = req.block_table[i]
-                    start = block_id * self.block_size
-                    if i != req.num_blocks - 1:
-                        end = start + self.block_size
-                    else:
-                        end = start + req.last_block_num_tokens
-                    slot_mapping.extend(list(range(start, end)))
-
-        input_ids = torch.tensor(input_ids, dtype=torch.int64, pin_memory=True).cuda(
-            non_blocking=True
-        )
-        positions = torch.tensor(positions, dtype=torch.int64, pin_memory=True).cuda(
-            non_blocking=True
+            block_ids = np.asarray(
+                req.block_table[req.num_cached_blocks : req.num_blocks], dtype=np.int32
+            )
+            if block_ids.size:
+                # Every slot of each uncached block, minus the unused tail of the last
+                slots = (block_ids[:, None] * self.block_size + block_offsets).ravel()
+                num_slots = slots.size - (self.block_size - req.last_block_num_tokens)
+                slot_mapping.append(slots[:num_slots])
+
+        has_prefix_cache = cu_seqlens_k[-1] > cu_seqlens_q[-1]
+        slot_mapping = (
+            np.concatenate(slot_mapping) if slot_mapping else np.empty(0, np.int32)
         )
-        cu_seqlens_q = torch.tensor(
-            cu_seqlens_q, dtype=torch.int32, pin_memory=True
-        ).cuda(non_blocking=True)
-        cu_seqlens_k = torch.tensor(
-            cu_seqlens_k, dtype=torch.int32, pin_memory=True
-        ).cuda(non_blocking=True)
-        slot_mapping = torch.tensor(
-            slot_mapping, dtype=torch.int32, pin_memory=True
-        ).cuda(non_blocking=True)
-
-        block_tables = None
-        if cu_seqlens_k[-1] > cu_seqlens_q[-1]:
-            max_len = max(len(req.block_table) for req in requests)
-            block_tables_list = []
-            for req in requests:
-                table = req.block_table + [-1] * (max_len - len(req.block_table))
-                block_tables_list.append(table)
-            block_tables = torch.tensor(
-                block_tables_list, dtype=torch.int32, pin_memory=True
+
+        # Uploads go through a side stream so they overlap with work already
+        # queued on the compute stream; generate() waits on _h2d_done right
+        # before the prefill forward.
+        compute_stream = torch.cuda.current_stream()
+        with torch.cuda.stream(self._h2d_stream):
+            cu_seqlens_q = torch.tensor(
+                cu_seqlens_q, dtype=torch.int32, pin_memory=True
             ).cuda(non_blocking=True)
+            cu_seqlens_k = torch.tensor(
+                cu_seqlens_k, dtype=torch.int32, pin_memory=True
+            ).cuda(non_blocking=True)
+            slot_mapping = torch.tensor(
+                slot_mapping, dtype=torch.int32, pin_memory=True
+            ).cuda(non_blocking=True)
+
+            block_tables = None
+            if has_prefix_cache:
+                self._h2d_stream.wait_event(self._block_tables_released)
+                self._load_block_tables(requests)
+                block_tables = self._dev_block_tables[: len(requests)]
+            self._h2d_done.record()
+
+        # Allocated on the side stream but consumed on the compute stream
+        for tensor in (cu_seqlens_q, cu_seqlens_k, slot_mapping):
+            tensor.record_stream(compute_stream)
 
         set_forward_context(
             True,
@@ -145,104 +387,160 @@ class AccelInferenceEngine:
             block_tables,
         )
 
-        return input_ids, positions
+    def _load_block_tables(self, requests: List[Seq]):
+        # The previous upload must drain before the pinned buffer is rewritten
+        self._staging_done.synchronize()
 
-    def _prepare_decode(self, requests: List[Seq]):
-        if not requests:
-            raise RuntimeError("FATAL: No requests provided to _prepare_decode!")
+        block_tables = self._pin_block_tables.numpy()
+        for i, req in enumerate(requests):
+            num_blocks = len(req.block_table)
+            block_tables[i, :num_blocks] = req.block_table
+            block_tables[i, num_blocks:] = -1
 
-        input_ids = []
-        positions = []
-        slot_mapping = []
-        context_lens = []
+        bs = len(requests)
+        self._dev_block_tables[:bs].copy_(
+            self._pin_block_tables[:bs], non_blocking=True
+        )
+        self._staging_done.record()
 
-        for req in requests:
-            input_ids.append(req.last_token)
+    def _reset_decode_padding(self, bs: int):
+        # Rows [bs, max_bs) are only ever run as padding of a larger graph
+        # bucket. A zero length makes prepare_decode_meta give them slot -1
+        # (no KV write) and an empty context; their sampled tokens are discarded.
+        self._seq_state["last_token"][bs:].zero_()
+        self._seq_state["length"][bs:].zero_()
+
+    def _compute_prefill_embeddings(
+        self,
+        input_ids: torch.Tensor,
+        tts_embeddings: Optional[torch.Tensor] = None,
+        tts_mel_embedding: Optional[torch.nn.Module] = None,
+        tts_text_pos_embedding: Optional[torch.nn.Module] = None,
+    ) -> torch.Tensor:
+        if (
+            tts_embeddings is not None
+            and tts_mel_embedding is not None
+            and tts_text_pos_embedding is not None
+        ):
+            start_token_id = input_ids[0, -1] if input_ids.size(1) > 0 else 8192
 
-            pos = len(req) - 1
-            if hasattr(self, "_tts_mode") and self._tts_mode:
-                pos = pos - (self._tts_prompt_len - 1)
-            positions.append(pos)
+            start_emb = tts_mel_embedding(
+                torch.tensor([[start_token_id]], device="cuda")
+            )  # [1, 1, hidden_dim]
+            start_emb = start_emb + tts_text_pos_embedding(start_emb)
 
-            context_lens.append(len(req))
-            slot_mapping.append(
-                req.block_table[-1] * self.block_size + req.last_block_num_tokens - 1
+            inputs_embeds = torch.cat(
+                [tts_embeddings, start_emb], dim=1
+            )  # [1, 88, hidden_dim]
+        else:
+            # Same token + position embedding GPT2Model applies to input_ids
+            position_ids = torch.arange(
+                input_ids.size(1), dtype=torch.long, device=input_ids.device
             )
+            inputs_embeds = self.model.wte(input_ids) + self.model.wpe(position_ids)
 
-        input_ids = torch.tensor(input_ids, dtype=torch.int64, pin_memory=True).cuda(
-            non_blocking=True
-        )
-        positions = torch.tensor(positions, dtype=torch.int64, pin_memory=True).cuda(
-            non_blocking=True
-        )
-        slot_mapping = torch.tensor(
-            slot_mapping, dtype=torch.int32, pin_memory=True
-        ).cuda(non_blocking=True)
-        context_lens = torch.tensor(
-            context_lens, dtype=torch.int32, pin_memory=True
-        ).cuda(non_blocking=True)
-
-        max_len = max(len(req.block_table) for req in requests)
-        block_tables_list = []
-        for req in requests:
-            table = req.block_table + [-1] * (max_len - len(req.block_table))
-            block_tables_list.append(table)
-        block_tables = torch.tensor(
-            block_tables_list, dtype=torch.int32, pin_memory=True
-        ).cuda(non_blocking=True)
-
-        assert block_tables.dim() == 2, (
-            f"block_tables must be 2D, got shape {block_tables.shape}"
-        )
-        assert block_tables.size(0) == len(requests), (
-            f"block_tables batch size mismatch: {block_tables.size(0)} vs {len(requests)}"
-        )
+        if inputs_embeds.dtype != self._model_dtype:
+            inputs_embeds = inputs_embeds.to(self._model_dtype)
+        return inputs_embeds
 
-        set_forward_context(
-            False,
-            slot_mapping=slot_mapping,
-            context_lens=context_lens,
-            block_tables=block_tables,
-        )
+    def _decode_forward(
+        self,
+        input_ids: torch.Tensor,
+        positions: torch.Tensor,
+        tts_mel_embedding: Optional[torch.nn.Module] = None,
+        tts_text_pos_embedding: Optional[torch.nn.Module] = None,
+    ) -> torch.Tensor:
+        if tts_mel_embedding is not None and tts_text_pos_embedding is not None:
+            if isinstance(tts_mel_embedding, nn.Embedding):
+                inputs_embeds = tts_embed_add(
+                    input_ids,
+                    positions,
+                    tts_mel_embedding.weight,
+                    tts_text_pos_embedding.emb.weight,
+                    self._model_dtype,
+                )
+            else:
+                inputs_embeds = tts_mel_embedding(input_ids)
+                pos_emb = tts_text_pos_embedding.emb(positions)
+                inputs_embeds = inputs_embeds + pos_emb
+                if inputs_embeds.dtype != self._model_dtype:
+                    inputs_embeds = inputs_embeds.to(self._model_dtype)
+            out = self.model(
+                inputs_embeds=inputs_embeds.unsqueeze(1), return_dict=True
+            ).last_hidden_state
+        else:
+            out = self.model(
+                input_ids=input_ids.unsqueeze(1), return_dict=True
+            ).last_hidden_state
+        return out.squeeze(1) if out.dim() == 3 else out
 
-        return input_ids, positions
+    def _compute_logits(self, hidden_states: torch.Tensor) -> torch.Tensor:
+        if self.lm_head is not None:
+            # Same cast on prefill, eager decode and inside the captured graph;
+            # a no-op whenever the model already runs in the lm_head dtype.
+            if hidden_states.dtype is not self._lm_head_dtype:
+                hidden_states = hidden_states.to(self._lm_head_dtype)
+            return self.lm_head(hidden_states)  # [batch_size, vocab_size]
+        return self.model.compute_logits(hidden_states)  # [batch_size, vocab_size]
+
+    def _decode_step(
+        self,
+        bs: int,
+        tts_mel_embedding: Optional[torch.nn.Module] = None,
+        tts_text_pos_embedding: Optional[torch.nn.Module] = None,
+    ):
+        # One decode step over rows [:bs] of the persistent buffers: metadata
+        # from the sequence state, forward, sampling, then the state advance.
+        seq_state = self._seq_state
+        input_ids = self._dev_input_ids[:bs]
+        positions = self._dev_positions[:bs]
+        prepare_decode_meta(
+            seq_state,
+            # Kept current incrementally as blocks are allocated; see _advance_sequences
+            self._dev_block_tables[:bs],
+            self.block_size,
+            self._pos_offset,
+            input_ids,
+            positions,
+            self._dev_slot_mapping[:bs],
+            self._dev_context_lens[:bs],
+        )
+        hidden_states = self._decode_forward(
+            input_ids, positions, tts_mel_embedding, tts_text_pos_embedding
+        )
+        logits = self._compute_logits(hidden_states)
+        next_token = self._dev_next_token[:bs]
+        next_token.copy_(self.sampler(logits, self._temperatures_dev[:bs]))
 
-    def _prepare_sample(self, requests: List[Seq], temperature: float):
-        temperatures = [temperature] * len(requests)
-        temperatures = torch.tensor(
-            temperatures, dtype=torch.float32, pin_memory=True
-        ).cuda(non_blocking=True)
-        return temperatures
+        seq_state["last_token"][:bs].copy_(next_token)
+        length = seq_state["length"][:bs]
+        length.add_((length > 0).to(length.dtype))
 
     @torch.inference_mode()
     def _capture_cuda_graphs(self, tts_mel_embedding=None, tts_text_pos_embedding=None):
         print("Capturing CUDA graphs for decode optimization...")
-        max_bs = 8  # Support up to batch size 8
-        max_num_blocks = (2048 + self.block_size - 1) // self.block_size
-        model_dtype = next(self.model.parameters()).dtype
-        input_ids = torch.ones(max_bs, dtype=torch.int64, device="cuda") * 8192
-        positions = torch.ones(max_bs, dtype=torch.int64, device="cuda")
-        slot_mapping = torch.zeros(max_bs, dtype=torch.int32, device="cuda")
-        context_lens = torch.zeros(max_bs, dtype=torch.int32, device="cuda")
-        block_tables = torch.zeros(
-            max_bs, max_num_blocks, dtype=torch.int32, device="cuda"
-        )
-        outputs = torch.zeros(
-            max_bs, self.hidden_size, dtype=model_dtype, device="cuda"
-        )
-        inputs_embeds_buffer = torch.zeros(
-            max_bs, self.hidden_size, dtype=model_dtype, device="cuda"
-        )
+        slot_mapping = self._dev_slot_mapping
+        context_lens = self._dev_context_lens
+        block_tables = self._dev_block_tables
+        seq_state = self._seq_state
 
-        self.graph_bs = [1]
+        # Padded buckets: a live batch is rounded up to the nearest captured size
+        self.graph_bs = sorted({1, 2, 4, 8})
 
         use_tts = tts_mel_embedding is not None and tts_text_pos_embedding is not None
+        if not use_tts:
+            tts_mel_embedding = tts_text_pos_embedding = None
 
+        # Capture the largest bucket first so smaller ones reuse its memory pool
         for bs in reversed(self.graph_bs):
             graph = torch.cuda.CUDAGraph()
 
-            slot_mapping[:bs] = torch.arange(bs, dtype=torch.int32, device="cuda")
-            context_lens[:bs] = bs + 1
+            # Dummy state: each row decodes into its own slot of block 0
+            seq_state["last_token"].zero_()
+            seq_state["length"].zero_()
+            seq_state["length"][:bs] = torch.arange(
+                1, bs + 1, dtype=torch.int32, device="cuda"
+            )
             block_tables[:bs, 0] = 0
 
             set_forward_context(
@@ -252,106 +550,60 @@ class AccelInferenceEngine:
                 block_tables=block_tables[:bs],
             )
 
-            # warmup
-            if use_tts:
-                assert tts_mel_embedding is not None
-                assert tts_text_pos_embedding is not None
-                emb = tts_mel_embedding(input_ids[:bs])
-                pos_clamped = torch.clamp(positions[:bs], min=0)
-                pos_emb = tts_text_pos_embedding.emb(pos_clamped)
-                inputs_embeds_buffer[:bs] = emb + pos_emb
-                out = self.model(
-                    inputs_embeds=inputs_embeds_buffer[:bs].unsqueeze(1),
-                    return_dict=True,
-                ).last_hidden_state
-            else:
-                out = self.model(
-                    input_ids=input_ids[:bs].unsqueeze(1), return_dict=True
-                ).last_hidden_state
-            outputs[:bs] = out.squeeze(1) if out.dim() == 3 else out
+            # warmup: let lazy allocations, cuBLAS handles and JIT settle
+            for _ in range(3):
+                self._decode_step(bs, tts_mel_embedding, tts_text_pos_embedding)
+            torch.cuda.synchronize()
 
+            # Metadata, embeddings, model, lm_head, sampler and the state
+            # advance are captured end to end; a replay leaves the sampled
+            # tokens in _dev_next_token.
             with torch.cuda.graph(graph, self.graph_pool):
-                if use_tts:
-                    assert tts_mel_embedding is not None
-                    assert tts_text_pos_embedding is not None
-                    emb = tts_mel_embedding(input_ids[:bs])
-                    pos_clamped = torch.clamp(positions[:bs], min=0)
-                    pos_emb = tts_text_pos_embedding.emb(pos_clamped)
-                    inputs_embeds_buffer[:bs] = emb + pos_emb
-                    out = self.model(
-                        inputs_embeds=inputs_embeds_buffer[:bs].unsqueeze(1),
-                        return_dict=True,
-                    ).last_hidden_state
-                else:
-                    out = self.model(
-                        input_ids=input_ids[:bs].unsqueeze(1), return_dict=True
-                    ).last_hidden_state
-                outputs[:bs] = out.squeeze(1) if out.dim() == 3 else out
+                self._decode_step(bs, tts_mel_embedding, tts_text_pos_embedding)
 
             if self.graph_pool is None:
                 self.graph_pool = graph.pool()
 
-            self.graphs[bs] = graph
             torch.cuda.synchronize()
+            self.graphs[bs] = graph
             reset_forward_context()
 
         self.graph_vars = {
-            "input_ids": input_ids,
-            "positions": positions,
             "slot_mapping": slot_mapping,
             "context_lens": context_lens,
             "block_tables": block_tables,
-            "outputs": outputs,
-            "inputs_embeds": inputs_embeds_buffer,
+            "next_token": self._dev_next_token,
         }
+        # Live batch size -> smallest captured bucket that fits it
+        self._bs_to_graph_bs = [
+            next((x for x in self.graph_bs if x >= bs), None)
+            for bs in range(self.max_bs + 1)
+        ]
         print(f"CUDA graphs captured for batch sizes: {self.graph_bs}")
 
     @torch.inference_mode()
     def _run_decode_with_graph(
         self,
-        input_ids: torch.Tensor,
-        positions: torch.Tensor,
-        context: ForwardContext,
+        bs: int,
         tts_mel_embedding: Optional[torch.nn.Module] = None,
         tts_text_pos_embedding: Optional[torch.nn.Module] = None,
     ) -> torch.Tensor:
-        bs = input_ids.size(0)
-        use_tts_embedding = hasattr(self, "_tts_mode") and self._tts_mode
+        use_tts_embedding = self._tts_mode
+        if not use_tts_embedding:
+            tts_mel_embedding = tts_text_pos_embedding = None
 
-        if not self.use_cuda_graph or not self.graphs:
-            if use_tts_embedding:
-                assert tts_mel_embedding is not None
-                assert tts_text_pos_embedding is not None
-                inputs_embeds = tts_mel_embedding(input_ids)
-                pos_clamped = torch.clamp(positions, min=0)
-                pos_emb = tts_text_pos_embedding.emb(pos_clamped)
-                inputs_embeds = inputs_embeds + pos_emb
-                out = self.model(
-                    inputs_embeds=inputs_embeds.unsqueeze(1), return_dict=True
-                ).last_hidden_state
-            else:
-                out = self.model(
-                    input_ids=input_ids.unsqueeze(1), return_dict=True
-                ).last_hidden_state
-            return out.squeeze(1) if out.dim() == 3 else out
-
-        graph_bs = next((x for x in self.graph_bs if x >= bs), None)
-        if graph_bs is None:
-            if use_tts_embedding:
-                assert tts_mel_embedding is not None
-                assert tts_text_pos_embedding is not None
-                inputs_embeds = tts_mel_embedding(input_ids)
-                pos_clamped = torch.clamp(positions, min=0)
-                pos_emb = tts_text_pos_embedding.emb(pos_clamped)
-                inputs_embeds = inputs_embeds + pos_emb
-                out = self.model(
-                    inputs_embeds=inputs_embeds.unsqueeze(1), return_dict=True
-                ).last_hidden_state
-            else:
-                out = self.model(
-                    input_ids=input_ids.unsqueeze(1), return_dict=True
-                ).last_hidden_state
-            return out.squeeze(1) if out.dim() == 3 else out
+        graph_bs = (
+            self._bs_to_graph_bs[bs] if bs < len(self._bs_to_graph_bs) else None
+        )
+        if not self.use_cuda_graph or graph_bs is None:
+            set_forward_context(
+                False,
+                slot_mapping=self._dev_slot_mapping[:bs],
+                context_lens=self._dev_context_lens[:bs],
+                block_tables=self._dev_block_tables[:bs],
+            )
+            self._decode_step(bs, tts_mel_embedding, tts_text_pos_embedding)
+            return self._dev_next_token[:bs]
 
         graph = self.graphs[graph_bs]
         graph_vars = self.graph_vars
@@ -366,18 +618,28 @@ class AccelInferenceEngine:
             block_tables=graph_vars["block_tables"][:graph_bs],
         )
 
-        graph_vars["input_ids"][:bs] = input_ids
-        graph_vars["positions"][:bs] = positions
-        graph_vars["slot_mapping"].fill_(-1)
-        graph_vars["slot_mapping"][:bs] = context.slot_mapping
-        graph_vars["context_lens"].zero_()
-        graph_vars["context_lens"][:bs] = context.context_lens
-        graph_vars["block_tables"][:bs, : context.block_tables.size(1)] = (
-            context.block_tables
-        )
         graph.replay()
 
-        return graph_vars["outputs"][:bs]
+        return graph_vars["next_token"][:bs]
+
+    def _flush_window(self, sequences: List[Seq]) -> int:
+        # Number of decode steps the host may fall behind before it has to
+        # catch up: bounded by the stop-check interval, and by the free slots
+        # left in each sequence's last block so new blocks are allocated in time.
+        headroom = min(
+            len(req.block_table) * self.block_size - len(req) for req in sequences
+        )
+        return min(self.stop_check_interval, headroom + 1)
+
+    def _first_stop(self, stop_hits: torch.Tensor) -> Optional[int]:
+        # The only host sync in steady-state decode: one small bool transfer
+        hits = stop_hits.tolist()
+        return hits.index(True) if True in hits else None
+
+    def _advance_sequences(self, sequences: List[Seq], num_tokens: int):
+        new_blocks = self.kv_manager.batch_append(sequences, num_tokens)
+        for seq_idx, block_idx, block_id in new_blocks:
+            self._dev_block_tables[seq_idx, block_idx] = block_id
 
     @torch.inference_mode()
     def generate(
@@ -407,15 +669,23 @@ class AccelInferenceEngine:
             top_k: Top-k sampling
             top_p: Nucleus sampling threshold
             stop_tokens: List of token IDs that stop generation
+            attention_mask: Ignored; prefill always runs on inputs_embeds
 
         Returns:
             Generated token IDs [batch_size, total_len]
         """
         batch_size = input_ids.size(0)
         device = input_ids.device
+        # Block tables, sequence state and temperatures are sized for max_bs
+        if batch_size > self.max_bs:
+            raise RuntimeError(
+                f"FATAL: batch_size={batch_size} exceeds CUDA Graph limit ({self.max_bs})!"
+            )
 
+        self._temperatures_dev.fill_(temperature)
         self._tts_mode = tts_embeddings is not None
         self._tts_prompt_len = input_ids.size(1) if self._tts_mode else 0
+        self._pos_offset.fill_(self._tts_prompt_len - 1 if self._tts_mode else 0)
 
         if self.use_cuda_graph and not self.graph_captured:
             print(
@@ -433,6 +703,7 @@ class AccelInferenceEngine:
                 file=sys.stderr,
                 flush=True,
             )
+        self.sampler.reseed()
 
         if tts_embeddings is not None:
             actual_seq_len = tts_embeddings.size(1) + 1  # embeddings + start_mel_token
@@ -454,59 +725,23 @@ class AccelInferenceEngine:
         self.current_sequences = sequences
 
         # Prefill phase
-        prefill_ids, prefill_pos = self._prepare_prefill(sequences)
-
-        if prefill_ids.dim() == 1:
-            prefill_ids = prefill_ids.unsqueeze(
-                0
-            )  # [total_tokens] -> [1, total_tokens]
-        if prefill_pos.dim() == 1:
-            prefill_pos = prefill_pos.unsqueeze(
-                0
-            )  # [total_tokens] -> [1, total_tokens]
-
-        if (
-            tts_embeddings is not None
-            and tts_mel_embedding is not None
-            and tts_text_pos_embedding is not None
-        ):
-            start_token_id = input_ids[0, -1] if input_ids.size(1) > 0 else 8192
-
-            start_emb = tts_mel_embedding(
-                torch.tensor([[start_token_id]], device="cuda")
-            )  # [1, 1, hidden_dim]
-
-            start_emb = start_emb + tts_text_pos_embedding(start_emb)
-
-            full_embeddings = torch.cat(
-                [tts_embeddings, start_emb], dim=1
-            )  # [1, 88, hidden_dim]
-
-            model_dtype = next(self.model.parameters()).dtype
-            if full_embeddings.dtype != model_dtype:
-                full_embeddings = full_embeddings.to(model_dtype)
-
-            hidden_states = self.model(
-                inputs_embeds=full_embeddings, return_dict=True
-            ).last_hidden_state
+        self._prepare_prefill(sequences)
 
-        else:
-            hidden_states = self.model(
-                input_ids=input_ids, attention_mask=attention_mask, return_dict=True
-            ).last_hidden_state
+        inputs_embeds = self._compute_prefill_embeddings(
+            input_ids, tts_embeddings, tts_mel_embedding, tts_text_pos_embedding
+        )
+        torch.cuda.current_stream().wait_event(self._h2d_done)
+        hidden_states = self.model(
+            inputs_embeds=inputs_embeds, return_dict=True
+        ).last_hidden_state
 
         reset_forward_context()
 
         last_hidden = hidden_states[:, -1, :]  # [batch_size, hidden_size]
 
-        if self.lm_head is not None:
-            if last_hidden.dtype != next(self.lm_head.parameters()).dtype:
-                last_hidden = last_hidden.to(next(self.lm_head.parameters()).dtype)
-            logits = self.lm_head(last_hidden)  # [batch_size, vocab_size]
-        else:
-            logits = self.model.compute_logits(last_hidden)  # [batch_size, vocab_size]
+        logits = self._compute_logits(last_hidden)
 
-        temperatures = self._prepare_sample(sequences, temperature)
+        temperatures = self._temperatures_dev[:batch_size]
         if temperature > 0:
             first_token = self.sampler(logits, temperatures)
         else:
@@ -534,6 +769,7 @@ class AccelInferenceEngine:
                 output_ids.append(full_sequence)
 
             output = torch.tensor(output_ids, dtype=torch.long, device=device)
+            self._block_tables_released.record()
             return output
 
         if not hit_stop_on_first:
@@ -541,55 +777,74 @@ class AccelInferenceEngine:
                 req.append_token(first_token_list[i])
                 self.kv_manager.append_to_seq(req)
 
-        remaining_tokens = max_new_tokens - 1
+        self._load_block_tables(sequences)
+        self._reset_decode_padding(batch_size)
+        self._seq_state["last_token"][:batch_size].copy_(first_token)
+        self._seq_state["length"][:batch_size].copy_(
+            torch.tensor([len(req) for req in sequences], dtype=torch.int32)
+        )
+
+        remaining_tokens = max(max_new_tokens - 1, 0)
+        stop_tokens_gpu = torch.tensor(
+            stop_tokens or [], dtype=torch.int64, device="cuda"
+        )
+        gen_tokens = torch.empty(
+            remaining_tokens, batch_size, dtype=torch.int64, device="cuda"
+        )
+        stop_hits = torch.zeros(remaining_tokens, dtype=torch.bool, device="cuda")
+
+        # Sampled tokens stay on the GPU until decoding ends. The host only
+        # checks the stop flags and advances sequence lengths once per
+        # window, so the loop does not synchronize on every token.
+        flushed = 0
+        window = self._flush_window(sequences)
+        num_steps = 0
+        stopped = False
 
         for step in range(remaining_tokens):
-            decode_ids, decode_pos = self._prepare_decode(sequences)
+            if step - flushed == window:
+                stop = self._first_stop(stop_hits[flushed:step])
+                if stop is not None:
+                    num_steps, stopped = flushed + stop + 1, True
+                    break
+                self._advance_sequences(sequences, step - flushed)
+                flushed = step
+                window = self._flush_window(sequences)
 
             # Forward pass
-            if batch_size > 8:
-                raise RuntimeError(
-                    f"FATAL: batch_size={batch_size} exceeds CUDA Graph limit (8)!"
-                )
-
-            context = get_forward_context()
-            hidden_states = self._run_decode_with_graph(
-                decode_ids,
-                decode_pos,
-                context,
+            next_token = self._run_decode_with_graph(
+                batch_size,
                 tts_mel_embedding=tts_mel_embedding,
                 tts_text_pos_embedding=tts_text_pos_embedding,
             )
-
-            # Get logits
-            if self.lm_head is not None:
-                logits = self.lm_head(hidden_states)  # [batch_size, vocab_size]
-            else:
-                logits = self.model.compute_logits(
-                    hidden_states
-                )  # [batch_size, vocab_size]
-
             reset_forward_context()
 
-            temperatures = self._prepare_sample(sequences, temperature)
-            if temperature > 0:
-                next_token = self.sampler(logits, temperatures)
-            else:
-                next_token = torch.argmax(logits, dim=-1)
-            next_token_list = next_token.tolist()
-
-            should_stop = False
-            for i, token_id in enumerate(next_token_list):
-                if stop_tokens and token_id in stop_tokens:
-                    should_stop = True
-                else:
-                    sequences[i].append_token(token_id)
-                    self.kv_manager.append_to_seq(sequences[i])
+            gen_tokens[step].copy_(next_token)
+            stop_hits[step] = (
+                next_token.unsqueeze(1) == stop_tokens_gpu.unsqueeze(0)
+            ).any()
+            num_steps = step + 1
+
+        self._block_tables_released.record()
+
+        if not stopped:
+            stop = self._first_stop(stop_hits[flushed:num_steps])
+            if stop is not None:
+                num_steps, stopped = flushed + stop + 1, True
+
+        # Single device-to-host transfer of everything generated. Decode steps
+        # run past a stop before it is noticed are dropped; on the stopping
+        # step, sequences that did not sample a stop token keep their token.
+        rows = gen_tokens[:num_steps].tolist()
+        num_accepted = num_steps - 1 if stopped else num_steps
+        for i, row_tokens in enumerate(zip(*rows[:num_accepted])):
+            generated_tokens[i].extend(row_tokens)
+        if stopped:
+            assert stop_tokens is not None
+            for i, token_id in enumerate(rows[-1]):
+                if token_id not in stop_tokens:
                     generated_tokens[i].append(token_id)
 
-            if should_stop:
-                break
-
         for req in sequences:
             self.kv_manager.remove_seq(req)
         self.current_sequences = []
@@ -76,12 +76,14 @@ class GPT2AccelAttention(nn.Module):
         k_flat = key.transpose(1, 2).contiguous().view(-1, num_heads, head_dim)
         v_flat = value.transpose(1, 2).contiguous().view(-1, num_heads, head_dim)
 
-        # ensure fp16
-        if q_flat.device.type == "cuda" and q_flat.dtype != torch.float16:
+        # match the KV cache dtype (fp16 unless the cache is wired otherwise)
+        k_cache = self.accel_attn.k_cache
+        attn_dtype = k_cache.dtype if k_cache.numel() else torch.float16
+        if q_flat.device.type == "cuda" and q_flat.dtype != attn_dtype:
             orig_dtype = q_flat.dtype
-            q_flat = q_flat.to(torch.float16)
-            k_flat = k_flat.to(torch.float16)
-            v_flat = v_flat.to(torch.float16)
+            q_flat = q_flat.to(attn_dtype)
+            k_flat = k_flat.to(attn_dtype)
+            v_flat = v_flat.to(attn_dtype)
         else:
             orig_dtype = q_flat.dtype
 
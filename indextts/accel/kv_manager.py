@@ -2,7 +2,7 @@ import hashlib
 import pickle
 from collections import deque
 from copy import copy
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 
 import torch
 
@@ -91,7 +91,6 @@ class KVCacheManager:
         self.used_block_ids: Set[int] = set()
 
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        cache_dtype = torch.float16 if device == "cuda" else dtype
         self.kv_cache = torch.empty(
             2,
             num_layers,
@@ -99,7 +98,7 @@ class KVCacheManager:
             block_size,
             num_heads,
             head_dim,
-            dtype=cache_dtype,
+            dtype=dtype,
             device=device,
         )
 
@@ -175,6 +174,8 @@ class KVCacheManager:
         sequence.block_table.clear()
 
     def append_to_seq(self, sequence: Seq):
+        # Hashes token_ids, which batch_append leaves behind num_tokens
+        assert len(sequence.token_ids) == len(sequence)
         block_table = sequence.block_table
         last_block = self.blocks[block_table[-1]]
 
@@ -197,6 +198,25 @@ class KVCacheManager:
         else:
             assert last_block.block_hash is None
 
+    def batch_append(
+        self, sequences: List[Seq], num_tokens: int
+    ) -> List[Tuple[int, int, int]]:
+        # Decode-time fast path: the appended tokens stay on the GPU, so only
+        # lengths are advanced and blocks are allocated as boundaries are
+        # crossed. Blocks filled here are not hashed for prefix reuse.
+        # token_ids and last_token are not updated, so a sequence advanced
+        # here must not go through append_to_seq or get_block_tokens again.
+        new_blocks = []
+        for seq_idx, sequence in enumerate(sequences):
+            sequence.num_tokens += num_tokens
+            block_table = sequence.block_table
+            while len(block_table) < sequence.num_blocks:
+                block_id = self.free_block_ids[0]
+                self._allocate_block(block_id)
+                block_table.append(block_id)
+                new_blocks.append((seq_idx, len(block_table) - 1, block_id))
+        return new_blocks
+
     def remove_seq(self, sequence: Seq):
         self.deallocate(sequence)
 